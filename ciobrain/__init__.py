@@ -70,4 +70,7 @@ def create_app(test_config=None):
 
     from . import db
     db.init_app(app)
+
+    from ciobrain.admin.documents import rag_evaluator
+    rag_evaluator.init_app(app)
     return app
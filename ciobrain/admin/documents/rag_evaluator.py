@@ -0,0 +1,466 @@
+"""
+ciobrain/admin/documents/rag_evaluator.py
+
+Retrieval regression harness over a versioned golden question set.
+
+Classes:
+    - HashingEmbeddings: deterministic, offline embedder for repeatable runs
+    - BM25Index: keyword ranking for the hybrid half of the sweep
+    - RAGEvaluator: sweeps chunking/retrieval settings and scores each one
+
+Run with ``flask --app ciobrain eval-retrieval``.
+"""
+
+import hashlib
+import itertools
+import json
+import logging
+import math
+import os
+import re
+import statistics
+import tempfile
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import click
+from flask import current_app
+from langchain.retrievers.multi_query import MultiQueryRetriever
+from langchain_chroma import Chroma
+from langchain_core.embeddings import Embeddings
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableLambda
+
+from ciobrain.admin.documents.rag_manager import (
+    CHUNK_OVERLAP,
+    CHUNK_SIZE,
+    QUERY_PROMPT,
+    RAGManager,
+)
+
+GOLDEN_SET = 'golden_set.json'
+EXPANSION_MODES = ('none', 'multi_query')
+RRF_K = 60
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercase word tokens shared by the hashing embedder and BM25."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class HashingEmbeddings(Embeddings):
+    """Bag-of-words feature hashing; same text always yields the same vector."""
+
+    def __init__(self, dimensions: int = 512):
+        self.dimensions = dimensions
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        vector = [0.0] * self.dimensions
+        for token in tokenize(text):
+            digest = hashlib.md5(token.encode('utf-8')).digest()
+            index = int.from_bytes(digest[:4], 'little') % self.dimensions
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+
+class BM25Index:
+    """Minimal Okapi BM25 over chunk texts for the keyword half of hybrid search."""
+
+    def __init__(self, texts: list[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_counts = [Counter(tokenize(text)) for text in texts]
+        self.lengths = [sum(counts.values()) for counts in self.term_counts]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        document_frequency = Counter()
+        for counts in self.term_counts:
+            document_frequency.update(counts.keys())
+        total = len(texts)
+        self.idf = {
+            term: math.log(1 + (total - freq + 0.5) / (freq + 0.5))
+            for term, freq in document_frequency.items()
+        }
+
+    def search(self, query: str, k: int) -> list[int]:
+        """Return indices of the top ``k`` chunks for ``query``."""
+        terms = [term for term in tokenize(query) if term in self.idf]
+        scores = []
+        for index, counts in enumerate(self.term_counts):
+            score = 0.0
+            length_norm = self.k1 * (1 - self.b + self.b * self.lengths[index] / (self.avg_length or 1.0))
+            for term in terms:
+                freq = counts.get(term, 0)
+                if freq:
+                    score += self.idf[term] * freq * (self.k1 + 1) / (freq + length_norm)
+            if score > 0:
+                scores.append((score, index))
+        scores.sort(key=lambda item: (-item[0], item[1]))
+        return [index for _, index in scores[:k]]
+
+    def size_bytes(self) -> int:
+        """Size of the postings and idf table serialized as JSON, i.e. what it would cost to persist."""
+        return len(json.dumps([dict(counts) for counts in self.term_counts])) + len(json.dumps(self.idf))
+
+
+def reciprocal_rank_fusion(weighted_rankings, k: int) -> list:
+    """Merge ``(documents, weight)`` rankings into the top ``k`` documents by weighted RRF."""
+    scores, documents = {}, {}
+    for ranked, weight in weighted_rankings:
+        for rank, doc in enumerate(ranked, start=1):
+            key = (doc.metadata.get('page'), doc.page_content)
+            documents.setdefault(key, doc)
+            scores[key] = scores.get(key, 0.0) + weight / (RRF_K + rank)
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return [documents[key] for key in ranked[:k]]
+
+
+def percentile(values: list[float], percent: int) -> float:
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    index = max(0, math.ceil(percent / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def directory_size(dir_path: str) -> int:
+    """Total bytes on disk under ``dir_path``."""
+    total = 0
+    for root, _, files in os.walk(dir_path):
+        for filename in files:
+            total += os.path.getsize(os.path.join(root, filename))
+    return total
+
+
+@dataclass(frozen=True)
+class EvalConfig:
+    """One point in the sweep."""
+    chunk_size: int = CHUNK_SIZE
+    chunk_overlap: int = CHUNK_OVERLAP
+    k: int = 4
+    expansion: str = 'none'
+    hybrid_weight: float = 0.0
+
+
+@dataclass
+class EvalResult:
+    """Scores and costs measured for a single EvalConfig."""
+    config: EvalConfig
+    recall: float
+    mrr: float
+    chunks: int
+    index_bytes: int
+    bm25_bytes: int
+    ingest_seconds: float
+    latency_ms_mean: float
+    latency_ms_p95: float
+
+
+@dataclass
+class EvalIndex:
+    """Chroma (and optional BM25) index built once per chunking setting."""
+    chunks: list
+    vector_db: Chroma
+    persist_dir: str
+    ingest_seconds: float
+    bm25: BM25Index | None = None
+    bm25_seconds: float = 0.0
+    index_bytes: int = 0
+
+    def close(self) -> None:
+        """Release the Chroma client so its segments are flushed, then measure the index on disk."""
+        client = self.vector_db._client
+        if hasattr(client, 'close'):
+            client.close()
+        else:
+            # chromadb < 1.0 has no close(); stop the cached system by hand.
+            client._system.stop()
+            client.clear_system_cache()
+        self.index_bytes = directory_size(self.persist_dir)
+
+
+class RAGEvaluator:
+    """Scores retrieval configurations against a golden question set"""
+
+    def __init__(self, embedding=None, llm=None, rag_manager=None):
+        self.embedding = embedding or HashingEmbeddings()
+        self.llm = llm
+        self.rag_manager = rag_manager or RAGManager()
+
+    def load_golden_set(self, golden_path: str) -> dict:
+        """Load and validate a golden set file."""
+        with open(golden_path, encoding='utf-8') as f:
+            golden_set = json.load(f)
+        if 'version' not in golden_set:
+            raise ValueError(f"Golden set {golden_path} has no version")
+        if not golden_set.get('handbook'):
+            raise ValueError(f"Golden set {golden_path} has no handbook")
+        if not golden_set.get('questions'):
+            raise ValueError(f"Golden set {golden_path} has no questions")
+        for entry in golden_set['questions']:
+            if not entry.get('question') or not entry.get('pages'):
+                raise ValueError(f"Golden entry {entry.get('id')} needs a question and pages")
+            if not isinstance(entry['pages'], list):
+                raise ValueError(f"Golden entry {entry.get('id')} pages must be a list")
+        return golden_set
+
+    def validate_configs(self, configs) -> None:
+        """Reject configs that cannot be evaluated before any work is done."""
+        if not configs:
+            raise ValueError("No configurations to evaluate")
+        for config in configs:
+            if config.expansion not in EXPANSION_MODES:
+                raise ValueError(f"Unknown expansion mode: {config.expansion}")
+            if config.expansion == 'multi_query' and self.llm is None:
+                raise ValueError("multi_query expansion requires an LLM")
+            if config.expansion == 'multi_query' and config.hybrid_weight > 0:
+                raise ValueError("multi_query expansion is vector only and cannot be combined with hybrid")
+            if config.k <= 0:
+                raise ValueError(f"k must be positive, got {config.k}")
+            if config.chunk_size <= 0:
+                raise ValueError(f"Chunk size must be positive, got {config.chunk_size}")
+            if config.chunk_overlap < 0:
+                raise ValueError(f"Overlap must not be negative, got {config.chunk_overlap}")
+            if config.chunk_overlap >= config.chunk_size:
+                raise ValueError(f"Overlap {config.chunk_overlap} must be smaller than chunk size {config.chunk_size}")
+            if not 0 <= config.hybrid_weight <= 1:
+                raise ValueError(f"Hybrid weight {config.hybrid_weight} must be between 0 and 1")
+
+    def sweep(self, pages, golden_set, configs, max_workers=4) -> list[EvalResult]:
+        """
+        Evaluate every config; results keep the order of ``configs``.
+
+        One index is built per (chunk_size, chunk_overlap), in parallel across
+        those groups. Every retrieval setting is then scored serially against
+        its group's index, so query latency is not measured while other
+        indexes are still embedding.
+        """
+        self.validate_configs(configs)
+        if not pages:
+            raise ValueError("No pages to index")
+
+        questions = golden_set['questions']
+        groups = {}
+        for config in configs:
+            groups.setdefault((config.chunk_size, config.chunk_overlap), []).append(config)
+
+        expansions, expansion_ms = {}, {}
+        if any(config.expansion == 'multi_query' for config in configs):
+            # Ask the LLM once per question so every config sees the same rewritten queries,
+            # and keep how long it took so multi_query latencies still include generation.
+            chain = QUERY_PROMPT | self.llm | StrOutputParser()
+            for entry in questions:
+                start = time.perf_counter()
+                expansions[QUERY_PROMPT.format(question=entry['question'])] = chain.invoke({"question": entry['question']})
+                expansion_ms[entry['question']] = (time.perf_counter() - start) * 1000
+
+        with tempfile.TemporaryDirectory(prefix='ciobrain-eval-') as work_dir:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {
+                    key: executor.submit(
+                        self.build_index, pages, key[0], key[1],
+                        os.path.join(work_dir, f"{key[0]}_{key[1]}"),
+                        any(config.hybrid_weight > 0 for config in group),
+                    )
+                    for key, group in groups.items()
+                }
+            try:
+                indexes = {key: future.result() for key, future in futures.items()}
+                scores = {
+                    config: self.score(
+                        indexes[(config.chunk_size, config.chunk_overlap)], questions, config, expansions, expansion_ms
+                    )
+                    for config in configs
+                }
+            finally:
+                for future in futures.values():
+                    if future.exception() is None:
+                        future.result().close()
+
+        results = []
+        for config in configs:
+            index = indexes[(config.chunk_size, config.chunk_overlap)]
+            hybrid = config.hybrid_weight > 0
+            recall, mrr, latencies = scores[config]
+            results.append(EvalResult(
+                config=config,
+                recall=recall,
+                mrr=mrr,
+                chunks=len(index.chunks),
+                index_bytes=index.index_bytes,
+                bm25_bytes=index.bm25.size_bytes() if hybrid else 0,
+                ingest_seconds=index.ingest_seconds + (index.bm25_seconds if hybrid else 0.0),
+                latency_ms_mean=statistics.mean(latencies),
+                latency_ms_p95=percentile(latencies, 95),
+            ))
+        return results
+
+    def evaluate(self, pages, questions, config: EvalConfig) -> EvalResult:
+        """Build an index for a single ``config`` and score it against ``questions``."""
+        return self.sweep(pages, {'questions': questions}, [config], max_workers=1)[0]
+
+    def build_index(self, pages, chunk_size, chunk_overlap, persist_dir, with_bm25=False) -> EvalIndex:
+        """Chunk ``pages`` and embed them into a fresh Chroma collection under ``persist_dir``."""
+        start = time.perf_counter()
+        chunks = self.rag_manager.chunk_documents(pages, chunk_size, chunk_overlap)
+        if not chunks:
+            raise ValueError(f"No chunks produced for chunk_size={chunk_size}, overlap={chunk_overlap}")
+        vector_db = Chroma.from_documents(
+            documents=chunks,
+            embedding=self.embedding,
+            collection_name=f"eval_{uuid.uuid4().hex}",
+            persist_directory=persist_dir,
+        )
+        index = EvalIndex(chunks, vector_db, persist_dir, time.perf_counter() - start)
+        # Untimed warm-up so the first scored question does not pay for loading the segment.
+        vector_db.similarity_search(chunks[0].page_content, k=1)
+
+        if with_bm25:
+            start = time.perf_counter()
+            index.bm25 = BM25Index([chunk.page_content for chunk in chunks])
+            index.bm25_seconds = time.perf_counter() - start
+
+        logging.info(f"Indexed {len(chunks)} chunks for chunk_size={chunk_size}, overlap={chunk_overlap}")
+        return index
+
+    def score(self, index: EvalIndex, questions, config: EvalConfig, expansions=None, expansion_ms=None):
+        """
+        Return mean recall, MRR and per-question latencies (ms) for ``config``.
+
+        For multi_query, each latency includes the time the LLM took to expand
+        that question in ``sweep``, since the timed call only reads the cache.
+        """
+        retriever = self._retriever(index, config, expansions or {})
+        recalls, reciprocal_ranks, latencies = [], [], []
+        for entry in questions:
+            start = time.perf_counter()
+            retrieved = retriever(entry['question'])
+            latency = (time.perf_counter() - start) * 1000
+            if config.expansion == 'multi_query':
+                latency += (expansion_ms or {}).get(entry['question'], 0.0)
+            latencies.append(latency)
+
+            expected = set(entry['pages'])
+            retrieved_pages = [chunk.metadata.get('page') for chunk in retrieved]
+            recalls.append(len(expected.intersection(retrieved_pages)) / len(expected))
+            reciprocal_ranks.append(next(
+                (1 / rank for rank, page in enumerate(retrieved_pages, start=1) if page in expected), 0.0
+            ))
+
+        logging.info(f"Evaluated {config}")
+        return statistics.mean(recalls), statistics.mean(reciprocal_ranks), latencies
+
+    def _retriever(self, index: EvalIndex, config: EvalConfig, expansions):
+        """Build a ``question -> documents`` callable for ``config``."""
+        if config.expansion == 'multi_query':
+            # Same retriever RAGManager.create_retriever builds, fed the cached LLM output.
+            cached_llm = RunnableLambda(lambda prompt_value: expansions[prompt_value.to_string()])
+            multi_query = MultiQueryRetriever.from_llm(
+                index.vector_db.as_retriever(search_kwargs={'k': config.k}), cached_llm, prompt=QUERY_PROMPT
+            )
+            return multi_query.invoke
+
+        if config.hybrid_weight == 0:
+            return index.vector_db.as_retriever(search_kwargs={'k': config.k}).invoke
+
+        fetch = config.k * 4
+
+        def hybrid(question):
+            rankings = [([index.chunks[i] for i in index.bm25.search(question, fetch)], config.hybrid_weight)]
+            if config.hybrid_weight < 1:
+                rankings.append((index.vector_db.similarity_search(question, k=fetch), 1 - config.hybrid_weight))
+            return reciprocal_rank_fusion(rankings, config.k)
+
+        return hybrid
+
+
+def format_table(results: list[EvalResult]) -> str:
+    """Render results best-first: recall, then MRR, then smallest index."""
+    headers = ('chunk', 'overlap', 'k', 'expansion', 'hybrid', 'recall@k', 'MRR',
+               'chunks', 'index KB', 'bm25 KB', 'ingest s', 'query ms', 'p95 ms')
+    ordered = sorted(results, key=lambda r: (-r.recall, -r.mrr, r.index_bytes + r.bm25_bytes, r.latency_ms_mean))
+    rows = [
+        (
+            str(r.config.chunk_size), str(r.config.chunk_overlap), str(r.config.k),
+            r.config.expansion, f"{r.config.hybrid_weight:.2f}",
+            f"{r.recall:.3f}", f"{r.mrr:.3f}", str(r.chunks),
+            f"{r.index_bytes / 1024:.0f}", f"{r.bm25_bytes / 1024:.0f}", f"{r.ingest_seconds:.2f}",
+            f"{r.latency_ms_mean:.1f}", f"{r.latency_ms_p95:.1f}",
+        )
+        for r in ordered
+    ]
+    widths = [max(len(row[i]) for row in [headers, *rows]) for i in range(len(headers))]
+    lines = ['  '.join(cell.rjust(width) for cell, width in zip(row, widths)) for row in [headers, *rows]]
+    lines.insert(1, '  '.join('-' * width for width in widths))
+    return '\n'.join(lines)
+
+
+def _list_option(cast):
+    """Click callback parsing a comma-separated option into a list of ``cast`` values."""
+    def callback(ctx, param, value):
+        try:
+            return [cast(item.strip()) for item in value.split(',') if item.strip()]
+        except ValueError:
+            raise click.BadParameter(f"expected comma-separated {cast.__name__} values, got {value!r}")
+    return callback
+
+
+@click.command('eval-retrieval')
+@click.option('--golden', default=None, help='Golden set JSON (default: KNOWLEDGE/golden_set.json).')
+@click.option('--chunk-sizes', default=str(CHUNK_SIZE), callback=_list_option(int), help='Comma-separated chunk sizes.')
+@click.option('--overlaps', default=str(CHUNK_OVERLAP), callback=_list_option(int), help='Comma-separated chunk overlaps.')
+@click.option('--k', 'ks', default='4', callback=_list_option(int), help='Comma-separated k values.')
+@click.option('--expansion', default='none', callback=_list_option(str),
+              help=f"Comma-separated modes from {', '.join(EXPANSION_MODES)}.")
+@click.option('--hybrid', default='0', callback=_list_option(float),
+              help='Comma-separated BM25 weights in [0, 1]; 0 is vector only.')
+@click.option('--embedding-model', default=None, help='Ollama embedding model; default is the offline hashing embedder.')
+@click.option('--llm', 'llm_model', default=None, help='Ollama chat model for multi_query expansion.')
+@click.option('--workers', default=4, show_default=True, help='Indexes built in parallel.')
+def eval_retrieval_command(golden, chunk_sizes, overlaps, ks, expansion, hybrid,
+                           embedding_model, llm_model, workers):
+    """
+    Sweep chunking and retrieval settings against the golden set.
+    """
+    embedding, llm = None, None
+    if embedding_model:
+        from langchain_ollama import OllamaEmbeddings
+        embedding = OllamaEmbeddings(model=embedding_model)
+    if llm_model:
+        from langchain_ollama.chat_models import ChatOllama
+        llm = ChatOllama(model=llm_model)
+
+    evaluator = RAGEvaluator(embedding=embedding, llm=llm)
+    combinations = itertools.product(chunk_sizes, overlaps, ks, expansion, hybrid)
+    configs = [EvalConfig(*combination) for combination in combinations]
+    # The live multi-query retriever has no keyword half, so skip those cross-product points.
+    skipped = [config for config in configs if config.expansion == 'multi_query' and config.hybrid_weight > 0]
+    configs = [config for config in configs if config not in skipped]
+    if skipped:
+        click.echo(f"Skipping {len(skipped)} multi_query configurations with hybrid > 0")
+
+    try:
+        evaluator.validate_configs(configs)
+        golden_set = evaluator.load_golden_set(golden or os.path.join(current_app.config['KNOWLEDGE'], GOLDEN_SET))
+        handbook_path = os.path.join(current_app.config['KNOWLEDGE'], golden_set['handbook'])
+        if not os.path.exists(handbook_path):
+            raise ValueError(f"Handbook not found at {handbook_path}")
+        pages = evaluator.rag_manager.extract_text(handbook_path)
+        results = evaluator.sweep(pages, golden_set, configs, max_workers=workers)
+    except (OSError, ValueError) as e:
+        raise click.ClickException(str(e))
+
+    click.echo(f"Golden set v{golden_set['version']}: {len(golden_set['questions'])} questions, "
+               f"{len(configs)} configurations")
+    click.echo(format_table(results))
+
+
+def init_app(app):
+    app.cli.add_command(eval_retrieval_command)
@@ -15,6 +15,19 @@ from langchain.prompts import ChatPromptTemplate
 
 logging.basicConfig(level=logging.INFO)
 
+CHUNK_SIZE = 1200
+CHUNK_OVERLAP = 300
+
+QUERY_PROMPT = PromptTemplate(
+    input_variables=["question"],
+    template="""You are an AI language model assistant. Your task is to generate five
+    different versions of the given user question to retrieve relevant documents from
+    a vector database. By generating multiple perspectives on the user question, your
+    goal is to help the user overcome some of the limitations of the distance-based
+    similarity search. Provide these alternative questions separated by newlines.
+    Original question: {question}""",
+)
+
 class RAGManager:
 
     def process_handbook(self, handbook_filename):
@@ -36,13 +49,17 @@ class RAGManager:
         vector_db = self.load_or_create_vector_db(document_chunks)
         return vector_db
 
-    def split_document(self, doc_path):
+    def split_document(self, doc_path, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
         if not os.path.exists(doc_path):
             logging.error(f"Document not found at {doc_path}")
             return []
 
         documents = self.extract_text(doc_path)
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1200, chunk_overlap=300)
+        return self.chunk_documents(documents, chunk_size, chunk_overlap)
+
+    def chunk_documents(self, documents, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+        """Split extracted pages into overlapping chunks."""
+        text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
         document_chunks = text_splitter.split_documents(documents)
         logging.info(f"Document split into {len(document_chunks)} chunks.")
         return document_chunks
@@ -53,7 +70,7 @@ class RAGManager:
             for page in pdf.pages:
                 text = page.extract_text()
                 if text:  # Add extracted text if available
-                    documents.append(Document(page_content=text))
+                    documents.append(Document(page_content=text, metadata={"page": page.page_number}))
         logging.info(f"Extracted {len(documents)} pages from the PDF.")
         return documents
 
@@ -114,16 +131,6 @@ class RAGManager:
             
     def create_retriever(self, vector_db, llm):
         """Create a multi-query retriever."""
-        QUERY_PROMPT = PromptTemplate(
-            input_variables=["question"],
-            template="""You are an AI language model assistant. Your task is to generate five
-            different versions of the given user question to retrieve relevant documents from
-            a vector database. By generating multiple perspectives on the user question, your
-            goal is to help the user overcome some of the limitations of the distance-based
-            similarity search. Provide these alternative questions separated by newlines.
-            Original question: {question}""",
-        )
-
         logging.info("Creating multi-query retriever...")
         retriever = MultiQueryRetriever.from_llm(
             vector_db.as_retriever(), llm, prompt=QUERY_PROMPT
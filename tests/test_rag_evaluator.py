@@ -0,0 +1,238 @@
+import json
+import os
+import time
+
+import pytest
+from click.testing import CliRunner
+from langchain_core.documents import Document
+from langchain_core.language_models.fake import FakeListLLM
+from langchain_core.runnables import RunnableLambda
+
+from ciobrain.admin.documents.rag_evaluator import (
+    BM25Index,
+    EvalConfig,
+    EvalResult,
+    HashingEmbeddings,
+    RAGEvaluator,
+    eval_retrieval_command,
+    format_table,
+    percentile,
+    reciprocal_rank_fusion,
+)
+
+PAGES = [
+    Document(page_content="apples oranges bananas", metadata={"page": 1}),
+    Document(page_content="cars trucks engines engines", metadata={"page": 2}),
+    Document(page_content="rivers lakes oceans", metadata={"page": 3}),
+]
+
+# Large chunks with no overlap keep one chunk per page.
+ONE_CHUNK_PER_PAGE = dict(chunk_size=1000, chunk_overlap=0)
+
+
+class CountingEmbeddings(HashingEmbeddings):
+    def __init__(self):
+        super().__init__()
+        self.document_calls = 0
+
+    def embed_documents(self, texts):
+        self.document_calls += 1
+        return super().embed_documents(texts)
+
+
+def test_evaluate_exact_recall_and_mrr():
+    questions = [
+        {"question": "apples bananas", "pages": [1]},   # hit at rank 1
+        {"question": "trucks engines", "pages": [2]},   # hit at rank 1
+        {"question": "apples", "pages": [3]},           # miss
+        {"question": "apples", "pages": [1, 2]},        # half recalled, hit at rank 1
+    ]
+    result = RAGEvaluator().evaluate(PAGES, questions, EvalConfig(k=1, **ONE_CHUNK_PER_PAGE))
+
+    assert result.recall == pytest.approx((1 + 1 + 0 + 0.5) / 4)
+    assert result.mrr == pytest.approx((1 + 1 + 0 + 1) / 4)
+    assert result.chunks == 3
+    assert result.index_bytes > 0
+    assert result.bm25_bytes == 0
+
+
+def test_evaluate_hybrid_second_rank():
+    # Pure BM25: "engines" appears twice on page 2, so page 1 ranks second.
+    questions = [{"question": "engines apples", "pages": [1]}]
+    result = RAGEvaluator().evaluate(PAGES, questions, EvalConfig(k=2, hybrid_weight=1.0, **ONE_CHUNK_PER_PAGE))
+
+    assert result.recall == 1.0
+    assert result.mrr == pytest.approx(0.5)
+    assert result.bm25_bytes > 0
+
+
+def test_sweep_builds_one_index_per_chunking_setting():
+    embedding = CountingEmbeddings()
+    questions = [{"question": "apples", "pages": [1]}]
+    configs = [
+        EvalConfig(k=1, **ONE_CHUNK_PER_PAGE),
+        EvalConfig(k=2, **ONE_CHUNK_PER_PAGE),
+        EvalConfig(k=2, hybrid_weight=0.5, **ONE_CHUNK_PER_PAGE),
+        EvalConfig(chunk_size=10, chunk_overlap=0, k=1),
+    ]
+    results = RAGEvaluator(embedding=embedding).sweep(PAGES, {"questions": questions}, configs, max_workers=2)
+
+    assert embedding.document_calls == 2
+    assert [result.config for result in results] == configs
+    assert results[0].index_bytes == results[1].index_bytes == results[2].index_bytes
+    assert results[3].chunks > results[0].chunks
+
+
+def test_multi_query_matches_live_retriever():
+    # Like MultiQueryRetriever, the original question is not searched and the union is not truncated.
+    llm = FakeListLLM(responses=["apples\n\nengines"])
+    questions = [{"question": "rivers", "pages": [1, 2, 3]}]
+    result = RAGEvaluator(llm=llm).evaluate(PAGES, questions, EvalConfig(k=1, expansion='multi_query', **ONE_CHUNK_PER_PAGE))
+
+    assert result.recall == pytest.approx(2 / 3)
+    assert result.mrr == 1.0
+
+
+def test_multi_query_latency_includes_expansion():
+    def slow_llm(prompt_value):
+        time.sleep(0.05)
+        return "apples"
+
+    questions = [{"question": "rivers", "pages": [1]}]
+    evaluator = RAGEvaluator(llm=RunnableLambda(slow_llm))
+    results = evaluator.sweep(PAGES, {"questions": questions}, [
+        EvalConfig(k=1, **ONE_CHUNK_PER_PAGE),
+        EvalConfig(k=1, expansion='multi_query', **ONE_CHUNK_PER_PAGE),
+    ])
+
+    assert results[0].latency_ms_mean < 50
+    assert results[1].latency_ms_mean >= 50
+    assert results[1].latency_ms_p95 >= 50
+
+
+def test_sweep_rejects_empty_pages():
+    with pytest.raises(ValueError, match="No pages"):
+        RAGEvaluator().sweep([], {"questions": [{"question": "q", "pages": [1]}]}, [EvalConfig()])
+
+
+def test_sweep_rejects_pages_without_text():
+    blank = [Document(page_content="   ", metadata={"page": 1})]
+    with pytest.raises(ValueError, match="No chunks"):
+        RAGEvaluator().sweep(blank, {"questions": [{"question": "q", "pages": [1]}]}, [EvalConfig()])
+
+
+def test_bm25_search():
+    index = BM25Index([doc.page_content for doc in PAGES])
+
+    assert index.search("engines apples", 3) == [1, 0]
+    assert index.search("oceans", 3) == [2]
+    assert index.search("missing", 3) == []
+    assert index.search("engines apples", 1) == [1]
+
+
+def test_reciprocal_rank_fusion_weights():
+    first, second, third = PAGES
+    fused = reciprocal_rank_fusion([([first, second], 0.2), ([third, second], 0.8)], k=3)
+
+    # second: 0.2/62 + 0.8/62, third: 0.8/61, first: 0.2/61
+    assert fused == [second, third, first]
+    assert reciprocal_rank_fusion([([first, second], 0.2), ([second, third], 0.8)], k=2) == [second, third]
+    assert reciprocal_rank_fusion([([first, second], 1.0)], k=1) == [first]
+
+
+def test_percentile():
+    values = [5.0, 1.0, 3.0, 2.0, 4.0]
+
+    assert percentile(values, 95) == 5.0
+    assert percentile(values, 50) == 3.0
+    assert percentile(values, 0) == 1.0
+    assert percentile([7.0], 95) == 7.0
+
+
+@pytest.mark.parametrize('config, message', [
+    (EvalConfig(k=0), "k must be positive"),
+    (EvalConfig(chunk_size=0, chunk_overlap=0), "Chunk size must be positive"),
+    (EvalConfig(chunk_overlap=-1), "must not be negative"),
+    (EvalConfig(chunk_size=100, chunk_overlap=100), "must be smaller"),
+    (EvalConfig(hybrid_weight=1.5), "between 0 and 1"),
+    (EvalConfig(expansion='hyde'), "Unknown expansion"),
+    (EvalConfig(expansion='multi_query'), "requires an LLM"),
+])
+def test_validate_configs_errors(config, message):
+    with pytest.raises(ValueError, match=message):
+        RAGEvaluator().validate_configs([config])
+
+
+def test_validate_configs_rejects_multi_query_hybrid():
+    evaluator = RAGEvaluator(llm=FakeListLLM(responses=["q"]))
+    with pytest.raises(ValueError, match="cannot be combined"):
+        evaluator.validate_configs([EvalConfig(expansion='multi_query', hybrid_weight=0.5)])
+
+
+@pytest.mark.parametrize('golden_set, message', [
+    ({"handbook": "h.pdf", "questions": [{"question": "q", "pages": [1]}]}, "no version"),
+    ({"version": 1, "questions": [{"question": "q", "pages": [1]}]}, "no handbook"),
+    ({"version": 1, "handbook": "h.pdf", "questions": []}, "no questions"),
+    ({"version": 1, "handbook": "h.pdf", "questions": [{"id": "x", "question": "q", "pages": []}]},
+     "needs a question and pages"),
+    ({"version": 1, "handbook": "h.pdf", "questions": [{"id": "x", "question": "q", "pages": 16}]},
+     "pages must be a list"),
+])
+def test_load_golden_set_errors(tmp_path, golden_set, message):
+    path = tmp_path / 'golden.json'
+    path.write_text(json.dumps(golden_set))
+    with pytest.raises(ValueError, match=message):
+        RAGEvaluator().load_golden_set(str(path))
+
+
+def test_load_golden_set_accepts_shipped_set():
+    golden_set = RAGEvaluator().load_golden_set(
+        os.path.join(os.path.dirname(__file__), '..', 'instance', 'knowledge', 'golden_set.json')
+    )
+
+    assert golden_set['handbook'] == 'Handbook-CIO.pdf'
+
+
+def test_format_table_orders_best_first():
+    def result(recall, mrr, index_kb, bm25_kb=0):
+        return EvalResult(EvalConfig(), recall, mrr, 1, index_kb * 1024, bm25_kb * 1024, 0.0, 1.0, 1.0)
+
+    table = format_table([
+        result(0.5, 0.5, 100),
+        result(0.9, 0.4, 100),
+        result(0.9, 0.8, 300),
+        result(0.9, 0.8, 100, bm25_kb=100),
+    ])
+    rows = [row.split() for row in table.splitlines()[2:]]
+
+    # recall, MRR, index KB, bm25 KB; ties on quality go to the smaller total index.
+    assert [row[5:7] + row[8:10] for row in rows] == [
+        ['0.900', '0.800', '100', '100'],
+        ['0.900', '0.800', '300', '0'],
+        ['0.900', '0.400', '100', '0'],
+        ['0.500', '0.500', '100', '0'],
+    ]
+
+
+@pytest.mark.parametrize('args', [['--k', 'four'], ['--hybrid', 'x'], ['--chunk-sizes', '1.5']])
+def test_cli_rejects_unparseable_lists(args):
+    result = CliRunner().invoke(eval_retrieval_command, args)
+
+    assert result.exit_code == 2
+    assert 'Invalid value' in result.output
+
+
+def test_cli_rejects_invalid_config(tmp_path):
+    result = CliRunner().invoke(eval_retrieval_command, ['--k', '0', '--golden', str(tmp_path / 'golden.json')])
+
+    assert result.exit_code == 1
+    assert 'k must be positive' in result.output
+
+
+def test_cli_rejects_golden_set_without_handbook(tmp_path):
+    path = tmp_path / 'golden.json'
+    path.write_text(json.dumps({"version": 1, "questions": [{"question": "q", "pages": [1]}]}))
+    result = CliRunner().invoke(eval_retrieval_command, ['--golden', str(path)])
+
+    assert result.exit_code == 1
+    assert 'has no handbook' in result.output